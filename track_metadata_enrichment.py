@@ -7,19 +7,31 @@ by querying online music databases like MusicBrainz, Last.fm, and Discogs.
 """
 
 import os
-import sys
+import re
 import json
 import time
+import sqlite3
 import logging
 import argparse
+import functools
+import threading
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import requests
-from mutagen import File
-from mutagen.m4a import M4A
-from mutagen.easyid3 import EasyID3
-import hashlib
+from collections import Counter
+from urllib.parse import urlparse
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple, Union
+from concurrent.futures import Future, ThreadPoolExecutor
+
+try:
+    import orjson
+except ImportError:  # fall back to the standard library parser
+    orjson = None
+
+# requests, mutagen, hashlib and email.utils are imported where they are
+# first needed, so that --help and argument errors don't pay for loading them
+if TYPE_CHECKING:
+    import requests
+    from mutagen import FileType
+    from mutagen.easyid3 import EasyID3
 
 # Configure logging
 logging.basicConfig(
@@ -34,18 +46,247 @@ logger = logging.getLogger(__name__)
 
 # Constants
 API_KEYS_PATH = "api_keys.json"
-FILE_FORMAT = "mp3"
-WORKERS = 4
+FILE_FORMATS = ("mp3", "m4a", "flac")
+WORKERS = 16  # workers mostly wait on the per-host rate limits
+METADATA_FIELDS = ('title', 'artist', 'album', 'genre', 'date', 'mood')
+CACHE_PATH = ".meta_cache.sqlite"
+CACHE_TTL = 7 * 86400  # seconds
+THROTTLED_RETRIES = 3
+PROGRESS_PATH = ".progress.jsonl"
+
+def iter_audio_files(root: Path, formats: Tuple[str, ...] = FILE_FORMATS) -> Iterator[Path]:
+    """Recursively yield the audio files below root as they are found
+    
+    Files are yielded directory by directory, and the extensions are matched
+    case-insensitively, so every format is found in a single walk.
+    """
+    suffixes = tuple(f".{file_format}" for file_format in formats)
+    subdirectories = []
+    
+    try:
+        with os.scandir(root) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.path)
+                elif entry.name.lower().endswith(suffixes) and entry.is_file():
+                    yield Path(entry.path)
+    except OSError as e:
+        logger.warning(f"Could not scan directory {root}: {e}")
+    
+    for subdirectory in sorted(subdirectories):
+        yield from iter_audio_files(Path(subdirectory), formats)
+
+def compile_keyword_pattern(keywords: Dict[str, List[str]]) -> 're.Pattern':
+    """Compile keyword lists into one regex with a named group per list
+    
+    The alternation is wrapped in a lookahead, so finditer reports a match at
+    every position where any keyword starts, including overlapping ones.
+    """
+    alternatives = '|'.join(f"(?P<{name}>{'|'.join(map(re.escape, words))})"
+                            for name, words in keywords.items())
+    return re.compile(f"(?=(?:{alternatives}))")
+
+@functools.lru_cache(maxsize=512)
+def load_audio_file(path: str, mtime_ns: int) -> Optional[Union['EasyID3', 'FileType']]:
+    """Open an audio file with mutagen, cached per path and modification time
+    
+    mtime_ns is only used as part of the cache key, so a file that changed on
+    disk (including by our own save) is parsed again.
+    """
+    from mutagen import File
+    from mutagen.easyid3 import EasyID3
+    from mutagen.easymp4 import EasyMP4Tags
+    from mutagen.id3 import ID3NoHeaderError
+    
+    if path.lower().endswith('.mp3'):
+        try:
+            # EasyID3 only reads the ID3 tag, not the MPEG stream
+            return EasyID3(path)
+        except ID3NoHeaderError:
+            return File(path)
+    
+    # M4A has no standard mood atom, store it as a freeform iTunes key
+    if 'mood' not in EasyMP4Tags.Get:
+        EasyMP4Tags.RegisterFreeformKey('mood', 'MOOD')
+    
+    # easy=True gives M4A and FLAC files the same tag keys as EasyID3
+    return File(path, easy=True)
+
+def keep_padding(info) -> int:
+    """Padding policy for mutagen's save() that reuses the existing tag padding
+    
+    As long as the new tag fits into the space of the old one the audio data
+    stays where it is and only the tag region is rewritten. Files without
+    enough padding are rewritten once, leaving room for later edits.
+    """
+    return info.padding if info.padding >= 0 else 1024
+
+def json_loads(data):
+    """Parse JSON from bytes or str, using orjson when it is installed"""
+    return orjson.loads(data) if orjson else json.loads(data)
+
+def json_dumps(value) -> str:
+    """Serialize a value to a JSON string, using orjson when it is installed"""
+    return orjson.dumps(value).decode() if orjson else json.dumps(value)
+
+def cache_key(endpoint: str, *args) -> str:
+    """Build a cache key from an endpoint name and its normalized arguments"""
+    import hashlib
+    
+    normalized = '|'.join([endpoint] + [str(arg).strip().lower() for arg in args])
+    return hashlib.sha1(normalized.encode()).hexdigest()
+
+def memoize_json(endpoint: str, cache_empty: bool = False):
+    """Cache the JSON-serializable result of an API lookup method on disk
+    
+    Concurrent calls with the same arguments are collapsed: only the first
+    one performs the lookup, the others wait for and share its result.
+    Empty results are not cached, so failed or unsuccessful lookups are
+    retried on the next run. Methods that raise on failure instead can pass
+    cache_empty to cache empty answers too.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args):
+            key = cache_key(endpoint, *args)
+            
+            with self.inflight_lock:
+                if self.cache is not None:
+                    cached = self.cache.get(key)
+                    if cached is not None:
+                        return cached
+                
+                future = self.inflight_requests.get(key)
+                is_owner = future is None
+                if is_owner:
+                    future = Future()
+                    self.inflight_requests[key] = future
+            
+            if not is_owner:
+                return future.result()
+            
+            try:
+                result = func(self, *args)
+                if (result or cache_empty) and self.cache is not None:
+                    self.cache.set(key, result)
+                future.set_result(result)
+                return result
+            except Exception as e:
+                future.set_exception(e)
+                raise
+            finally:
+                with self.inflight_lock:
+                    del self.inflight_requests[key]
+        return wrapper
+    return decorator
+
+class ResponseCache:
+    """SQLite backed cache for API lookup results"""
+    
+    def __init__(self, path: str, ttl: float = CACHE_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(key TEXT PRIMARY KEY, created REAL NOT NULL, data TEXT NOT NULL)"
+        )
+        
+        # Drop expired entries, so the file doesn't keep growing between runs
+        self.connection.execute("DELETE FROM responses WHERE created < ?", (time.time() - ttl,))
+        self.connection.commit()
+    
+    def get(self, key: str):
+        """Return the cached value for key, or None if missing or expired"""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT created, data FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        
+        if row is None or time.time() - row[0] > self.ttl:
+            return None
+        return json_loads(row[1])
+    
+    def set(self, key: str, value):
+        """Store a JSON-serializable value under key"""
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, created, data) VALUES (?, ?, ?)",
+                (key, time.time(), json_dumps(value))
+            )
+            self.connection.commit()
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter"""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate  # tokens added per second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self.condition = threading.Condition()
+    
+    def acquire(self):
+        """Take a token, waiting only as long as it takes for one to become available"""
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                
+                self.condition.wait((1 - self.tokens) / self.rate)
 
 class MetadataEnricher:
     """Main class for enriching track metadata"""
     
-    def __init__(self, api_keys: Dict = None):
+    # Mood keywords, in order of priority
+    MOOD_KEYWORDS = {
+        'energetic': ['energetic', 'upbeat', 'fast', 'dance', 'electronic', 'house', 'techno', 'trance', 'edm'],
+        'chill': ['chill', 'ambient', 'relaxed', 'downtempo', 'lounge', 'jazz', 'smooth', 'calm'],
+        'emotional': ['emotional', 'melancholic', 'sad', 'romantic', 'ballad', 'deep', 'atmospheric'],
+        'aggressive': ['aggressive', 'heavy', 'metal', 'rock', 'hardcore', 'intense', 'powerful'],
+        'groovy': ['groovy', 'funk', 'soul', 'disco', 'rhythm', 'swing', 'bass']
+    }
+    MOOD_PATTERN = compile_keyword_pattern(MOOD_KEYWORDS)
+    
+    # Genre words used as a fallback when no mood keywords are found
+    GENRE_MOODS = {
+        'energetic': ['house', 'techno', 'trance', 'edm', 'dance'],
+        'chill': ['ambient', 'lounge', 'jazz', 'chillout'],
+        'aggressive': ['metal', 'rock', 'hardcore'],
+        'groovy': ['funk', 'soul', 'disco']
+    }
+    GENRE_MOOD_PATTERN = compile_keyword_pattern(GENRE_MOODS)
+    
+    def __init__(self, api_keys: Dict = None, cache_path: Optional[str] = CACHE_PATH):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        
+        # requests already sends Accept-Encoding for every compression
+        # urllib3 can decode (gzip and deflate, plus br/zstd when brotli or
+        # zstandard is installed) and decompresses responses transparently
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'TrackMetadataEnricher/1.0 (DJ Playlist Tool)'
         })
         
+        # Keep enough pooled connections for every worker to reuse one, and
+        # retry failed requests with backoff. Throttled responses (429/503)
+        # are retried by api_get, so the retries go through the rate limits.
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=64,
+            max_retries=Retry(total=3, backoff_factor=0.5,
+                              status_forcelist=[500, 502, 504])
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        
         # API endpoints
         self.musicbrainz_url = "https://musicbrainz.org/ws/2"
         self.lastfm_url = "http://ws.audioscrobbler.com/2.0/"
@@ -57,10 +298,34 @@ class MetadataEnricher:
         self.discogs_token = self.api_keys.get('discogs_token', '')
         self.spotify_client_id = self.api_keys.get('spotify_client_id', '')
         self.spotify_client_secret = self.api_keys.get('spotify_client_secret', '')
+        self.discogs_headers = {'Authorization': f'Discogs token={self.discogs_token}'}
+        
+        # Persistent cache of API lookups, shared between runs
+        self.cache = ResponseCache(cache_path) if cache_path else None
+        
+        # Lookups currently in progress, used to collapse duplicate requests
+        self.inflight_requests: Dict[str, Future] = {}
+        self.inflight_lock = threading.Lock()
+        
+        # Online search results per (artist, title), MusicBrainz release
+        # recordings per (artist, album) and MusicBrainz genres per artist
+        # ID, shared by all files of the run
+        self.track_lookups: Dict[Tuple[str, ...], Future] = {}
+        self.album_lookups: Dict[Tuple[str, ...], Future] = {}
+        self.artist_lookups: Dict[Tuple[str, ...], Future] = {}
+        self.lookups_lock = threading.Lock()
         
-        # Rate limiting
-        self.last_request_time = 0
-        self.min_request_interval = 1.0  # seconds
+        # Rate limiting (per host, so MusicBrainz's 1 req/s policy
+        # doesn't throttle Last.fm and Discogs)
+        self.buckets = {
+            'musicbrainz.org': TokenBucket(rate=1, capacity=1),        # 1 request per second
+            'ws.audioscrobbler.com': TokenBucket(rate=5, capacity=5),  # 5 requests per second
+            'api.discogs.com': TokenBucket(rate=1, capacity=1)         # 60 requests per minute
+        }
+        
+        # Pool used to query the different APIs for one track concurrently,
+        # sized and started by process_directory
+        self.api_executor: Optional[ThreadPoolExecutor] = None
         
         # Check API key availability
         self.check_api_keys()
@@ -86,45 +351,83 @@ class MetadataEnricher:
         
         logger.info(f"Available APIs: {', '.join(available_apis)}")
         
-    def rate_limit(self):
-        """Implement rate limiting for API requests"""
-        current_time = time.time()
-        time_since_last = current_time - self.last_request_time
-        if time_since_last < self.min_request_interval:
-            time.sleep(self.min_request_interval - time_since_last)
-        self.last_request_time = time.time()
+    def api_get(self, url: str, **kwargs) -> 'requests.Response':
+        """Perform a rate limited GET request against one of the APIs
+        
+        Throttled responses (429/503, which MusicBrainz uses when over its
+        limit) are retried after the delay from Retry-After, taking a token
+        from the host's bucket for every attempt.
+        """
+        bucket = self.buckets[urlparse(url).netloc]
+        
+        for attempt in range(THROTTLED_RETRIES + 1):
+            bucket.acquire()
+            response = self.session.get(url, **kwargs)
+            if response.status_code not in (429, 503) or attempt == THROTTLED_RETRIES:
+                break
+            
+            delay = self.get_retry_delay(response, attempt)
+            logger.warning(f"Throttled by {urlparse(url).netloc}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+        
+        response.raise_for_status()
+        return response
     
-    def extract_metadata(self, file_path: Path) -> Dict:
-        """Extract existing metadata from audio file"""
+    def get_retry_delay(self, response: 'requests.Response', attempt: int) -> float:
+        """Return how long to wait before retrying a throttled request"""
+        from email.utils import parsedate_to_datetime
+        
+        retry_after = response.headers.get('Retry-After')
+        if retry_after:
+            try:
+                return max(0.0, float(retry_after))
+            except ValueError:
+                pass
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+        
+        # Exponential backoff when the server doesn't say
+        return 0.5 * 2 ** attempt
+    
+    def load_audio(self, file_path: Path) -> Tuple[Optional[Union['EasyID3', 'FileType']], Dict]:
+        """Open an audio file and extract its existing metadata
+        
+        The returned audio object can be passed to update_metadata, so the
+        file doesn't have to be opened and parsed a second time.
+        """
         try:
-            audio = File(str(file_path))
+            audio = load_audio_file(str(file_path), os.stat(file_path).st_mtime_ns)
             if audio is None:
-                return {}
+                return None, {}
             
             metadata = {}
             
-            # Extract basic metadata
-            if hasattr(audio, 'tags'):
-                tags = audio.tags
-                if hasattr(tags, 'get'):
-                    metadata['title'] = tags.get('title', [''])[0] if tags.get('title') else ''
-                    metadata['artist'] = tags.get('artist', [''])[0] if tags.get('artist') else ''
-                    metadata['album'] = tags.get('album', [''])[0] if tags.get('album') else ''
-                    metadata['genre'] = tags.get('genre', [''])[0] if tags.get('genre') else ''
-                    metadata['date'] = tags.get('date', [''])[0] if tags.get('date') else ''
-                    metadata['mood'] = tags.get('mood', [''])[0] if tags.get('mood') else ''
+            # Extract basic metadata, with a single lookup per field
+            tags = self.get_tags(audio)
+            if hasattr(tags, 'get'):
+                metadata = {field: (tags.get(field) or [''])[0] for field in METADATA_FIELDS}
             
-            return metadata
+            return audio, metadata
             
         except Exception as e:
             logger.error(f"Error extracting metadata from {file_path}: {e}")
-            return {}
+            return None, {}
+    
+    def get_tags(self, audio: Union['EasyID3', 'FileType']):
+        """Return the tag mapping of an audio object returned by load_audio"""
+        # EasyID3 objects are the tag mapping themselves
+        return getattr(audio, 'tags', audio)
     
+    def extract_metadata(self, file_path: Path) -> Dict:
+        """Extract existing metadata from audio file"""
+        return self.load_audio(file_path)[1]
+    
+    @memoize_json('musicbrainz_recording')
     def search_musicbrainz(self, artist: str, title: str) -> Dict:
         """Search MusicBrainz for track information"""
         try:
-            self.rate_limit()
-            
             # Clean search terms
             artist_clean = artist.replace('"', '').strip()
             title_clean = title.replace('"', '').strip()
@@ -137,10 +440,9 @@ class MetadataEnricher:
                 'limit': 1
             }
             
-            response = self.session.get(f"{self.musicbrainz_url}/recording/", params=params)
-            response.raise_for_status()
+            response = self.api_get(f"{self.musicbrainz_url}/recording/", params=params)
             
-            data = response.json()
+            data = json_loads(response.content)
             if data.get('recordings'):
                 recording = data['recordings'][0]
                 
@@ -155,7 +457,7 @@ class MetadataEnricher:
                 if recording.get('artist-credit'):
                     artist_id = recording['artist-credit'][0].get('artist', {}).get('id')
                     if artist_id:
-                        result['genre'] = self.get_musicbrainz_genres(artist_id)
+                        result['genre'] = self.get_artist_genres(artist_id)
                 
                 return result
                 
@@ -164,30 +466,92 @@ class MetadataEnricher:
         
         return {}
     
-    def get_musicbrainz_genres(self, artist_id: str) -> List[str]:
-        """Get genres for an artist from MusicBrainz"""
+    @memoize_json('musicbrainz_release')
+    def search_musicbrainz_release(self, artist: str, album: str) -> Dict:
+        """Search MusicBrainz for a release and return its recordings keyed by lowercase title
+        
+        Recordings carry their artist's ID instead of genres, so genres are
+        only looked up for the tracks that are actually in the library.
+        """
         try:
-            self.rate_limit()
+            # Clean search terms
+            artist_clean = artist.replace('"', '').strip()
+            album_clean = album.replace('"', '').strip()
             
-            response = self.session.get(f"{self.musicbrainz_url}/artist/{artist_id}", 
-                                      params={'fmt': 'json', 'inc': 'genres'})
-            response.raise_for_status()
+            # Search for release
+            search_query = f'artist:"{artist_clean}" AND release:"{album_clean}"'
+            params = {
+                'query': search_query,
+                'fmt': 'json',
+                'limit': 1
+            }
             
-            data = response.json()
-            return [genre['name'] for genre in data.get('genres', [])]
+            response = self.api_get(f"{self.musicbrainz_url}/release/", params=params)
             
+            data = json_loads(response.content)
+            if data.get('releases'):
+                release_id = data['releases'][0]['id']
+                
+                # Get all recordings of the release at once
+                response = self.api_get(f"{self.musicbrainz_url}/release/{release_id}",
+                                        params={'fmt': 'json', 'inc': 'recordings+artist-credits'})
+                release = json_loads(response.content)
+                
+                recordings = {}
+                for medium in release.get('media', []):
+                    for track in medium.get('tracks', []):
+                        recording = track.get('recording', {})
+                        artist_credit = (recording.get('artist-credit') or 
+                                         release.get('artist-credit') or [{}])[0]
+                        
+                        result = {
+                            'title': recording.get('title', ''),
+                            'artist': artist_credit.get('name', ''),
+                            'artist_id': artist_credit.get('artist', {}).get('id', ''),
+                            'date': recording.get('first-release-date') or release.get('date', ''),
+                            'genre': []
+                        }
+                        
+                        recordings[result['title'].strip().lower()] = result
+                
+                return recordings
+                
         except Exception as e:
-            logger.warning(f"Failed to get genres for artist {artist_id}: {e}")
-            return []
+            logger.warning(f"MusicBrainz release search failed for {artist} - {album}: {e}")
+        
+        return {}
+    
+    @memoize_json('musicbrainz_artist', cache_empty=True)
+    def get_musicbrainz_genres(self, artist_id: str) -> List[str]:
+        """Get genres for an artist from MusicBrainz
+        
+        Failed requests raise, so only real answers are cached, including
+        the empty genre list of an artist without genres.
+        """
+        response = self.api_get(f"{self.musicbrainz_url}/artist/{artist_id}", 
+                                params={'fmt': 'json', 'inc': 'genres'})
+        
+        data = json_loads(response.content)
+        return [genre['name'] for genre in data.get('genres', [])]
     
+    def get_artist_genres(self, artist_id: str) -> List[str]:
+        """Get genres for an artist, looking them up once per run"""
+        def lookup() -> List[str]:
+            try:
+                return self.get_musicbrainz_genres(artist_id)
+            except Exception as e:
+                logger.warning(f"Failed to get genres for artist {artist_id}: {e}")
+                return []
+        
+        return self.run_once(self.artist_lookups, (artist_id,), lookup)
+    
+    @memoize_json('lastfm_track')
     def search_lastfm(self, artist: str, title: str) -> Dict:
         """Search Last.fm for track information and mood tags"""
         if not self.lastfm_api_key or self.lastfm_api_key == 'YOUR_LASTFM_API_KEY_HERE':
             return {}
             
         try:
-            self.rate_limit()
-            
             params = {
                 'method': 'track.getInfo',
                 'artist': artist,
@@ -196,10 +560,9 @@ class MetadataEnricher:
                 'format': 'json'
             }
             
-            response = self.session.get(self.lastfm_url, params=params)
-            response.raise_for_status()
+            response = self.api_get(self.lastfm_url, params=params)
             
-            data = response.json()
+            data = json_loads(response.content)
             if 'track' in data:
                 track = data['track']
                 
@@ -219,18 +582,13 @@ class MetadataEnricher:
         
         return {}
     
+    @memoize_json('discogs_search')
     def search_discogs(self, artist: str, title: str) -> Dict:
         """Search Discogs for release information"""
         if not self.discogs_token or self.discogs_token == 'YOUR_DISCOGS_TOKEN_HERE':
             return {}
             
         try:
-            self.rate_limit()
-            
-            headers = {
-                'Authorization': f'Discogs token={self.discogs_token}'
-            }
-            
             # Search for release
             params = {
                 'q': f'{artist} {title}',
@@ -238,17 +596,16 @@ class MetadataEnricher:
                 'limit': 1
             }
             
-            response = self.session.get(f"{self.discogs_url}/database/search", 
-                                      params=params, headers=headers)
-            response.raise_for_status()
+            response = self.api_get(f"{self.discogs_url}/database/search", 
+                                    params=params, headers=self.discogs_headers)
             
-            data = response.json()
+            data = json_loads(response.content)
             if data.get('results'):
                 result = data['results'][0]
                 
                 # Get detailed release info
                 release_id = result['id']
-                release_info = self.get_discogs_release(release_id, headers)
+                release_info = self.get_discogs_release(release_id)
                 
                 return {
                     'year': release_info.get('year', ''),
@@ -261,16 +618,14 @@ class MetadataEnricher:
         
         return {}
     
-    def get_discogs_release(self, release_id: int, headers: Dict) -> Dict:
+    @memoize_json('discogs_release')
+    def get_discogs_release(self, release_id: int) -> Dict:
         """Get detailed release information from Discogs"""
         try:
-            self.rate_limit()
-            
-            response = self.session.get(f"{self.discogs_url}/releases/{release_id}", 
-                                      headers=headers)
-            response.raise_for_status()
+            response = self.api_get(f"{self.discogs_url}/releases/{release_id}", 
+                                    headers=self.discogs_headers)
             
-            return response.json()
+            return json_loads(response.content)
             
         except Exception as e:
             logger.warning(f"Failed to get Discogs release {release_id}: {e}")
@@ -278,43 +633,34 @@ class MetadataEnricher:
     
     def classify_mood(self, tags: List[str], genre: str = '') -> str:
         """Classify mood based on tags and genre"""
-        mood_keywords = {
-            'energetic': ['energetic', 'upbeat', 'fast', 'dance', 'electronic', 'house', 'techno', 'trance', 'edm'],
-            'chill': ['chill', 'ambient', 'relaxed', 'downtempo', 'lounge', 'jazz', 'smooth', 'calm'],
-            'emotional': ['emotional', 'melancholic', 'sad', 'romantic', 'ballad', 'deep', 'atmospheric'],
-            'aggressive': ['aggressive', 'heavy', 'metal', 'rock', 'hardcore', 'intense', 'powerful'],
-            'groovy': ['groovy', 'funk', 'soul', 'disco', 'rhythm', 'swing', 'bass']
-        }
-        
         # Combine tags and genre for analysis
         text_to_analyze = ' '.join(tags + [genre]).lower()
         
-        for mood, keywords in mood_keywords.items():
-            if any(keyword in text_to_analyze for keyword in keywords):
-                return mood
+        mood = self.match_mood(self.MOOD_PATTERN, self.MOOD_KEYWORDS, text_to_analyze)
+        if mood:
+            return mood
         
         # Fallback based on genre if no mood keywords found
-        genre_lower = genre.lower()
-        if any(word in genre_lower for word in ['house', 'techno', 'trance', 'edm', 'dance']):
-            return 'energetic'
-        elif any(word in genre_lower for word in ['ambient', 'lounge', 'jazz', 'chillout']):
-            return 'chill'
-        elif any(word in genre_lower for word in ['metal', 'rock', 'hardcore']):
-            return 'aggressive'
-        elif any(word in genre_lower for word in ['funk', 'soul', 'disco']):
-            return 'groovy'
+        mood = self.match_mood(self.GENRE_MOOD_PATTERN, self.GENRE_MOODS, genre.lower())
+        if mood:
+            return mood
         
         return 'neutral'
+    
+    def match_mood(self, pattern: 're.Pattern', keywords: Dict[str, List[str]], 
+                   text: str) -> Optional[str]:
+        """Return the highest priority mood whose keywords occur in text"""
+        found = {match.lastgroup for match in pattern.finditer(text)}
+        for mood in keywords:
+            if mood in found:
+                return mood
+        return None
 
-    def update_metadata(self, file_path: Path, new_metadata: Dict) -> bool:
-        """Update audio file with new metadata"""
+    def update_metadata(self, audio: Union['EasyID3', 'FileType'], new_metadata: Dict) -> bool:
+        """Update an audio file opened by load_audio with new metadata"""
         try:
-            audio = File(str(file_path))
-            if audio is None:
-                return False
-            
-            if hasattr(audio, 'tags'):
-                tags = audio.tags
+            tags = self.get_tags(audio)
+            if tags is not None:
                 
                 # Update tags
                 if new_metadata.get('genre'):
@@ -326,35 +672,137 @@ class MetadataEnricher:
                 if new_metadata.get('mood'):
                     tags['mood'] = [new_metadata['mood']]
                 
-                # Save changes
-                audio.save()
+                # Save changes in place, without moving the audio data
+                audio.save(padding=keep_padding)
                 return True
                 
         except Exception as e:
-            logger.error(f"Error updating metadata for {file_path}: {e}")
+            logger.error(f"Error updating metadata for {audio.filename}: {e}")
+            # The cached object now holds tags that never reached the disk,
+            # drop it so the file is parsed again on the next read
+            load_audio_file.cache_clear()
         
         return False
     
-    def process_file(self, file_path: Path) -> Dict:
-        """Process a single audio file"""
-        logger.info(f"Processing: {file_path.name}")
+    def needs_work(self, file_path: Path) -> bool:
+        """Check whether genre, date or mood is missing, reading only those tags"""
+        try:
+            audio = load_audio_file(str(file_path), os.stat(file_path).st_mtime_ns)
+        except Exception:
+            # Let load_audio report the error
+            return True
         
-        # Extract existing metadata
-        existing_metadata = self.extract_metadata(file_path)
+        tags = self.get_tags(audio) if audio is not None else None
+        if not hasattr(tags, 'get'):
+            return True
         
-        # Check what's missing
+        return not all((tags.get(field) or [''])[0] for field in ('genre', 'date', 'mood'))
+    
+    def get_missing_fields(self, metadata: Dict) -> List[str]:
+        """Return the enrichable fields missing from existing metadata"""
         missing_fields = []
-        if not existing_metadata.get('genre'):
+        if not metadata.get('genre'):
             missing_fields.append('genre')
-        if not existing_metadata.get('date'):
+        if not metadata.get('date'):
             missing_fields.append('year')
-        if not existing_metadata.get('mood'):
+        if not metadata.get('mood'):
             missing_fields.append('mood')
+        return missing_fields
+    
+    def run_once(self, lookups: Dict[Tuple[str, ...], Future], key: Tuple[str, ...], func):
+        """Call func only once per key for the rest of the run
+        
+        Later and concurrent callers with the same key share the first call's
+        result, even an empty one.
+        """
+        with self.lookups_lock:
+            future = lookups.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                lookups[key] = future
+        
+        if not is_owner:
+            return future.result()
+        
+        try:
+            result = func()
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+    
+    def get_album_recordings(self, artist: str, album: str) -> Dict:
+        """Get the recordings of an album, looking the release up once per run
+        
+        All tracks of an album share one search_musicbrainz_release lookup
+        instead of searching MusicBrainz one recording at a time.
+        """
+        key = (artist.strip().lower(), album.strip().lower())
+        return self.run_once(self.album_lookups, key,
+                             lambda: self.search_musicbrainz_release(artist, album))
+    
+    def submit_lookup(self, func, *args) -> Future:
+        """Run an API lookup on the lookup pool
+        
+        Outside process_directory there is no pool, and the lookup runs
+        right away in the calling thread.
+        """
+        if self.api_executor is not None:
+            return self.api_executor.submit(func, *args)
+        
+        future = Future()
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    
+    def search_track(self, artist: str, title: str, album: str = '') -> Tuple[Dict, Dict, Dict]:
+        """Search all online databases for a track
         
-        if not missing_fields:
+        Each (artist, title) is only looked up once per run: files with the
+        same track, such as duplicates or compilation copies, reuse the first
+        lookup's MusicBrainz, Last.fm and Discogs results, even empty ones.
+        """
+        def search() -> Tuple[Dict, Dict, Dict]:
+            # Query the services concurrently, they are independent
+            lfm_future = self.submit_lookup(self.search_lastfm, artist, title)
+            discogs_future = self.submit_lookup(self.search_discogs, artist, title)
+            
+            # Look the track up in its album's recordings before searching it on its own
+            album_tracks = self.get_album_recordings(artist, album) if album else {}
+            mb_data = album_tracks.get(title.strip().lower())
+            if mb_data:
+                # Genres of the matched recording only, not of the whole release
+                mb_data = dict(mb_data)
+                artist_id = mb_data.pop('artist_id', '')
+                if artist_id:
+                    mb_data['genre'] = self.get_artist_genres(artist_id)
+            else:
+                mb_data = self.search_musicbrainz(artist, title)
+            
+            return mb_data, lfm_future.result(), discogs_future.result()
+        
+        key = (artist.strip().lower(), title.strip().lower())
+        return self.run_once(self.track_lookups, key, search)
+    
+    def process_file(self, file_path: Path) -> Dict:
+        """Process a single audio file"""
+        logger.info(f"Processing: {file_path.name}")
+        
+        # Skip complete files without extracting the rest of their metadata
+        if not self.needs_work(file_path):
             logger.info(f"All metadata present for {file_path.name}")
             return {'file': file_path.name, 'status': 'complete', 'updated': False}
         
+        # Extract existing metadata, keeping the audio object for the update
+        audio, existing_metadata = self.load_audio(file_path)
+        
+        # Check what's missing
+        missing_fields = self.get_missing_fields(existing_metadata)
+        
         # Search for missing information
         artist = existing_metadata.get('artist', '')
         title = existing_metadata.get('title', '')
@@ -364,11 +812,13 @@ class MetadataEnricher:
             return {'file': file_path.name, 'status': 'missing_info', 'updated': False}
         
         # Search online databases
+        mb_data, lfm_data, discogs_data = self.search_track(artist, title, 
+                                                            existing_metadata.get('album', ''))
+        
         new_metadata = {}
         found_genre = ''
         
-        # Try MusicBrainz first
-        mb_data = self.search_musicbrainz(artist, title)
+        # Prefer MusicBrainz results
         if mb_data:
             if 'genre' in missing_fields and mb_data.get('genre'):
                 found_genre = mb_data['genre'][0] if isinstance(mb_data['genre'], list) else mb_data['genre']
@@ -376,8 +826,7 @@ class MetadataEnricher:
             if 'year' in missing_fields and mb_data.get('date'):
                 new_metadata['year'] = mb_data['date'][:4]
         
-        # Try Last.fm for mood and additional info
-        lfm_data = self.search_lastfm(artist, title)
+        # Use Last.fm for mood and additional info
         if lfm_data:
             if 'genre' in missing_fields and not new_metadata.get('genre') and lfm_data.get('genre'):
                 found_genre = lfm_data['genre']
@@ -387,8 +836,7 @@ class MetadataEnricher:
             if 'mood' in missing_fields and lfm_data.get('mood'):
                 new_metadata['mood'] = self.classify_mood(lfm_data['mood'], found_genre)
         
-        # Try Discogs for additional info
-        discogs_data = self.search_discogs(artist, title)
+        # Use Discogs for additional info
         if discogs_data:
             if 'year' in missing_fields and not new_metadata.get('year') and discogs_data.get('year'):
                 new_metadata['year'] = str(discogs_data['year'])
@@ -401,8 +849,8 @@ class MetadataEnricher:
             new_metadata['mood'] = self.classify_mood([], found_genre)
         
         # Update file if we found new metadata
-        if new_metadata:
-            success = self.update_metadata(file_path, new_metadata)
+        if new_metadata and audio is not None:
+            success = self.update_metadata(audio, new_metadata)
             if success:
                 logger.info(f"Updated {file_path.name} with: {new_metadata}")
                 return {'file': file_path.name, 'status': 'updated', 'metadata': new_metadata}
@@ -410,51 +858,137 @@ class MetadataEnricher:
         logger.warning(f"Could not find missing metadata for {file_path.name}")
         return {'file': file_path.name, 'status': 'not_found', 'updated': False}
     
-    def process_directory(self, directory: Path, max_workers: int = 4):
-        """Process all ${FILE_FORMAT} files in a directory"""
+    def load_progress(self, progress_path: str) -> Dict[str, int]:
+        """Return the files already finished according to the progress journal
+        
+        Maps each path to the st_mtime_ns it had when it was recorded. Only
+        updated and complete files are included, so files that failed or
+        had no metadata found are tried again.
+        """
+        processed = {}
+        try:
+            with open(progress_path, 'rb') as f:
+                for line in f:
+                    try:
+                        entry = json_loads(line)
+                    except ValueError:
+                        # Partially written line from an interrupted run
+                        continue
+                    if entry.get('status') in ('updated', 'complete') and 'mtime_ns' in entry:
+                        processed[entry.get('path')] = entry['mtime_ns']
+        except FileNotFoundError:
+            pass
+        
+        return processed
+    
+    def process_directory(self, directory: Path, max_workers: int = WORKERS, 
+                          progress_path: Optional[str] = PROGRESS_PATH, resume: bool = True):
+        """Process all audio files in a directory
+        
+        Each result is appended to the progress journal at progress_path as
+        soon as the file is done. With resume, files that an interrupted run
+        already finished are skipped unless they changed since. The journal
+        is removed once the run completes.
+        """
         if not directory.exists():
             logger.error(f"Directory does not exist: {directory}")
             return
         
-        # Find all audio files
-        audio_files = list(directory.glob(f"**/*.{FILE_FORMAT}"))
-        logger.info(f"Found {len(audio_files)} {FILE_FORMAT} files to process")
+        processed = self.load_progress(progress_path) if progress_path and resume else {}
+        counts = Counter()
+        counts_lock = threading.Lock()
+        progress_file = open(progress_path, 'a' if resume else 'w', buffering=1) if progress_path else None
         
-        if not audio_files:
-            logger.info(f"No {FILE_FORMAT} files found in directory")
-            return
+        # The number of queued files is bounded, so a large library isn't
+        # scanned far ahead of the workers
+        pending = threading.BoundedSemaphore(2 * max_workers)
         
-        # Process files in parallel
-        results = []
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_file = {executor.submit(self.process_file, file_path): file_path 
-                            for file_path in audio_files}
-            
-            for future in as_completed(future_to_file):
+        def record_result(file_path: Path, path: str, future: Future):
+            # Always free the slot, or the scan would block once enough
+            # results failed to be recorded
+            try:
                 try:
                     result = future.result()
-                    results.append(result)
                 except Exception as e:
-                    file_path = future_to_file[future]
                     logger.error(f"Error processing {file_path}: {e}")
-                    results.append({'file': file_path.name, 'status': 'error', 'error': str(e)})
+                    result = {'file': file_path.name, 'status': 'error', 'error': str(e)}
+                
+                entry = {'path': path, **result}
+                try:
+                    # Taken after any save, so an unchanged file is skipped on resume
+                    entry['mtime_ns'] = os.stat(file_path).st_mtime_ns
+                except OSError:
+                    pass
+                
+                with counts_lock:
+                    counts[result['status']] += 1
+                    if progress_file:
+                        try:
+                            progress_file.write(json_dumps(entry) + "\n")
+                        except OSError as e:
+                            logger.error(f"Could not record {file_path} in {progress_path}: {e}")
+            finally:
+                pending.release()
+        
+        # Process files in parallel, submitting each file as soon as it has
+        # been found so scanning overlaps with processing. Tags are only read
+        # by the workers, so the scan never waits on them.
+        self.api_executor = ThreadPoolExecutor(max_workers=3 * max_workers,
+                                               thread_name_prefix='api')
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for file_path in iter_audio_files(directory):
+                    path = os.path.abspath(file_path)
+                    if path in processed:
+                        try:
+                            unchanged = file_path.stat().st_mtime_ns == processed[path]
+                        except OSError:
+                            # Moved or deleted since the scan found it
+                            unchanged = False
+                        
+                        if unchanged:
+                            with counts_lock:
+                                counts['skipped'] += 1
+                            continue
+                    
+                    pending.acquire()
+                    future = executor.submit(self.process_file, file_path)
+                    future.add_done_callback(functools.partial(record_result, file_path, path))
+        finally:
+            self.api_executor.shutdown()
+            self.api_executor = None
+            if progress_file:
+                progress_file.close()
+        
+        # The run finished, so there is nothing left to resume
+        if progress_path:
+            try:
+                os.remove(progress_path)
+            except FileNotFoundError:
+                pass
+        
+        if not counts:
+            logger.info(f"No {', '.join(FILE_FORMATS)} files found in directory")
+            return
         
         # Summary
-        self.print_summary(results)
+        self.print_summary(counts)
     
-    def print_summary(self, results: List[Dict]):
-        """Print processing summary"""
-        total = len(results)
-        updated = sum(1 for r in results if r['status'] == 'updated')
-        complete = sum(1 for r in results if r['status'] == 'complete')
-        errors = sum(1 for r in results if r['status'] == 'error')
-        not_found = sum(1 for r in results if r['status'] == 'not_found')
-        missing_info = sum(1 for r in results if r['status'] == 'missing_info')
+    def print_summary(self, counts: Dict[str, int]):
+        """Print processing summary from per-status file counts"""
+        total = sum(counts.values())
+        updated = counts.get('updated', 0)
+        complete = counts.get('complete', 0)
+        errors = counts.get('error', 0)
+        not_found = counts.get('not_found', 0)
+        missing_info = counts.get('missing_info', 0)
+        skipped = counts.get('skipped', 0)
         
         logger.info("\n" + "="*50)
         logger.info("PROCESSING SUMMARY")
         logger.info("="*50)
         logger.info(f"Total files: {total}")
+        logger.info(f"Skipped (processed in an earlier run): {skipped}")
         logger.info(f"Updated: {updated}")
         logger.info(f"Already complete: {complete}")
         logger.info(f"Missing artist/title: {missing_info}")
@@ -465,8 +999,8 @@ class MetadataEnricher:
 def load_api_keys(api_keys_path: str) -> Dict:
     """Load API keys from JSON file"""
     try:
-        with open(api_keys_path, 'r') as f:
-            return json.load(f)
+        with open(api_keys_path, 'rb') as f:
+            return json_loads(f.read())
     except FileNotFoundError:
         logger.warning(f"API keys file not found: {api_keys_path}")
         return {}
@@ -479,6 +1013,11 @@ def main():
     parser.add_argument("directory", help="Directory containing audio files")
     parser.add_argument("--workers", type=int, default=WORKERS, help="Number of worker threads")
     parser.add_argument("--api-keys", help="Path to JSON file with API keys")
+    parser.add_argument("--no-cache", action="store_true",
+                        help=f"Don't read or write the API response cache ({CACHE_PATH})")
+    parser.add_argument("--restart", action="store_true",
+                        help=f"Ignore files recorded in the progress journal ({PROGRESS_PATH}) "
+                             "and process every file again")
     
     args = parser.parse_args()
     
@@ -493,8 +1032,8 @@ def main():
             api_keys = load_api_keys(str(default_keys_path))
     
     directory = Path(args.directory)
-    enricher = MetadataEnricher(api_keys)
-    enricher.process_directory(directory, args.workers)
+    enricher = MetadataEnricher(api_keys, cache_path=None if args.no_cache else CACHE_PATH)
+    enricher.process_directory(directory, args.workers, resume=not args.restart)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file